@@ -1,19 +1,19 @@
 import io
 import os
 import queue
+import sqlite3
 import time
 from threading import Thread
-from typing import Generator
+from typing import Generator, List, Optional
 
 import simplebot
-from cairosvg import svg2png
 from deltachat import Chat, Contact, Message
 from deltachat.capi import lib
 from deltachat.cutil import from_dc_charpointer
 from simplebot.bot import DeltaBot, Replies
 
 from .db import DBManager
-from .templates import template
+from .templates import get_template
 
 db: DBManager
 channel_posts: queue.Queue = queue.Queue()
@@ -26,6 +26,7 @@ def deltabot_init(bot: DeltaBot) -> None:
 
     _getdefault(bot, "max_topic_size", "500")
     _getdefault(bot, "max_file_size", "1048576")
+    _getdefault(bot, "channel_broadcast_size", "1")
 
     prefix = _getdefault(bot, "command_prefix", "")
 
@@ -40,6 +41,7 @@ def deltabot_init(bot: DeltaBot) -> None:
     bot.commands.register(func=remove_cmd, name=f"/{prefix}remove")
     bot.commands.register(func=topic_cmd, name=f"/{prefix}topic")
     bot.commands.register(func=adminchan_cmd, name=f"/{prefix}adminchan", admin=True)
+    bot.commands.register(func=adminmerge_cmd, name=f"/{prefix}adminmerge", admin=True)
     bot.commands.register(func=join_cmd, name=f"/{prefix}join")
     bot.commands.register(func=me_cmd, name=f"/{prefix}joined")
     bot.commands.register(func=list_cmd, name=f"/{prefix}list")
@@ -59,7 +61,8 @@ def deltabot_start(bot: DeltaBot) -> None:
 
 @simplebot.hookimpl
 def deltabot_member_removed(bot: DeltaBot, chat: Chat, contact: Contact) -> None:
-    if bot.self_contact == contact or len(chat.get_contacts()) <= 1:
+    contacts = chat.get_contacts()
+    if bot.self_contact == contact or len(contacts) <= 1:
         if db.get_group(chat.id):
             db.remove_group(chat.id)
             return
@@ -75,6 +78,8 @@ def deltabot_member_removed(bot: DeltaBot, chat: Chat, contact: Contact) -> None
                 db.remove_channel(ch["id"])
             else:
                 db.remove_cchat(chat.id)
+    elif db.get_cchat(chat.id):
+        _update_members(bot, chat)
 
 
 @simplebot.hookimpl
@@ -82,6 +87,8 @@ def deltabot_image_changed(deleted: bool, bot: DeltaBot, chat: Chat) -> None:
     ch = db.get_channel(chat.id)
     if ch and ch["admin"] == chat.id:
         for cchat in _get_cchats(bot, ch["id"]):
+            if cchat.is_broadcast():
+                continue
             try:
                 if deleted:
                     cchat.delete_profile_image()
@@ -103,9 +110,9 @@ def deltabot_ban(bot: DeltaBot, contact: Contact) -> None:
 
     for ch in db.get_channels():
         for chat in _get_cchats(bot, ch["id"]):
-            contacts = chat.get_contacts()
-            if contact in contacts and me in contacts:
+            if contact in chat.get_contacts():
                 chat.remove_contact(contact)
+                _update_members(bot, chat)
 
 
 def filter_messages(bot: DeltaBot, message: Message, replies: Replies) -> None:
@@ -160,9 +167,7 @@ def info_cmd(bot: DeltaBot, message: Message, replies: Replies) -> None:
 
     ch = db.get_channel(chat.id)
     if ch:
-        count = sum(
-            map(lambda g: len(g.get_contacts()) - 1, _get_cchats(bot, ch["id"]))
-        )
+        count = _count_subscribers(bot, ch["id"])
         replies.add(
             text=f"{ch['name']}\n👤 {count}\n{ch['topic'] or '-'}\n\n⬅️ /{prefix}remove_c{ch['id']}\n➡️ /{prefix}join_c{ch['id']}"
         )
@@ -178,6 +183,8 @@ def info_cmd(bot: DeltaBot, message: Message, replies: Replies) -> None:
     svg = from_dc_charpointer(
         lib.dc_get_securejoin_qr_svg(bot.account._dc_context, chat.id)
     )
+    from cairosvg import svg2png  # pylint: disable=C0415
+
     png = io.BytesIO()
     svg2png(bytestring=svg, write_to=png)
     png.seek(0)
@@ -188,7 +195,7 @@ def list_cmd(bot: DeltaBot, replies: Replies) -> None:
     """Show the list of public groups and channels."""
 
     def get_list(bot_addr: str, chats: list) -> str:
-        return template.render(
+        return get_template("list.j2").render(
             bot_addr=bot_addr,
             prefix=_getdefault(bot, "command_prefix", ""),
             chats=chats,
@@ -217,9 +224,7 @@ def list_cmd(bot: DeltaBot, replies: Replies) -> None:
 
     channels = []
     for ch in db.get_channels():
-        count = sum(
-            map(lambda g: len(g.get_contacts()) - 1, _get_cchats(bot, ch["id"]))
-        )
+        count = _count_subscribers(bot, ch["id"])
         if ch["last_pub"]:
             last_pub = time.strftime("%d-%m-%Y", time.gmtime(ch["last_pub"]))
         else:
@@ -301,17 +306,13 @@ def join_cmd(bot: DeltaBot, args: list, message: Message, replies: Replies) -> N
                 if sender in g.get_contacts():
                     replies.add(
                         text=f"❌ {sender.addr}, you are already a member of this channel",
-                        chat=g,
+                        chat=bot.get_chat(sender) if g.is_broadcast() else g,
                     )
                     return
-            g = bot.create_group(ch["name"], [sender])
-            db.add_cchat(g.id, ch["id"])
-            img = bot.get_chat(ch["admin"]).get_profile_image()
-            if img and os.path.exists(img):
-                g.set_profile_image(img)
+            g = _add_subscriber(bot, ch, sender)
             replies.add(
                 text=f"{ch['name']}\n\n{ch['topic'] or '-'}\n\n⬅️ /{prefix}remove_{arg}",
-                chat=g,
+                chat=bot.get_chat(sender) if g.is_broadcast() else g,
             )
             return
 
@@ -332,6 +333,42 @@ def adminchan_cmd(
         replies.add(text="❌ Invalid ID")
 
 
+def adminmerge_cmd(bot: DeltaBot, args: list, replies: Replies) -> None:
+    """Move the subscribers of the given channel from their private groups to broadcast lists.
+
+    The maximum size of the broadcast lists is set with the channel_broadcast_size setting.
+    """
+    ch = db.get_channel_by_id(int(args[0])) if args else None
+    if not ch:
+        replies.add(text="❌ Invalid ID")
+        return
+    max_size = int(_getdefault(bot, "channel_broadcast_size"))
+    if max_size <= 1:
+        replies.add(text="❌ Broadcast lists are disabled")
+        return
+
+    chats = list(_get_cchats(bot, ch["id"], shared=False))
+    if not chats or (len(chats) < 2 and db.get_free_cchat(ch["id"], max_size) is None):
+        replies.add(text="❌ Nothing to merge")
+        return
+
+    prefix = _getdefault(bot, "command_prefix", "")
+    text = f"{ch['name']}\n\nFrom now on the channel posts will arrive in this chat\n\n⬅️ /{prefix}remove_c{ch['id']}"
+    moved = 0
+    for g in chats:
+        contacts = _move_subscribers(bot, ch, g)
+        if contacts is None:
+            continue
+        moved += len(contacts)
+        for contact in contacts:
+            replies.add(text=text, chat=bot.get_chat(contact))
+        try:
+            g.remove_contact(bot.self_contact)
+        except ValueError as ex:
+            bot.logger.exception(ex)
+    replies.add(text=f"✔️{moved} subscribers moved")
+
+
 def topic_cmd(bot: DeltaBot, payload: str, message: Message, replies: Replies) -> None:
     """Show or change group/channel topic."""
     if not message.chat.is_group():
@@ -349,7 +386,8 @@ def topic_cmd(bot: DeltaBot, payload: str, message: Message, replies: Replies) -
         if ch and ch["admin"] == message.chat.id:
             db.set_channel_topic(ch["id"], payload)
             for chat in _get_cchats(bot, ch["id"]):
-                replies.add(text=text, chat=chat)
+                sender = ch["name"] if chat.is_broadcast() else None
+                replies.add(text=text, sender=sender, chat=chat)
             replies.add(text=text)
             return
         if ch:
@@ -385,11 +423,8 @@ def remove_cmd(bot: DeltaBot, args: list, message: Message, replies: Replies) ->
         if not ch:
             replies.add(text="❌ Invalid ID")
             return
-        for g in _get_cchats(bot, ch["id"], include_admin=True):
-            if sender in g.get_contacts():
-                g.remove_contact(sender)
-                return
-        replies.add(text="❌ You are not a member of that channel")
+        if not _remove_subscriber(bot, ch, sender, replies):
+            replies.add(text="❌ You are not a member of that channel")
     elif type_ == "g":
         gr = db.get_group(gid)
         if not gr:
@@ -442,10 +477,12 @@ def _get_db(bot: DeltaBot) -> DBManager:
     path = os.path.join(os.path.dirname(bot.account.db_path), __name__)
     if not os.path.exists(path):
         os.makedirs(path)
-    return DBManager(os.path.join(path, "sqlite.db"))
+    return DBManager(os.path.join(path, "sqlite.db"), bot.logger)
 
 
-def _get_cchats(bot: DeltaBot, cgid: int, include_admin: bool = False) -> Generator:
+def _get_cchats(
+    bot: DeltaBot, cgid: int, include_admin: bool = False, shared: Optional[bool] = None
+) -> Generator:
     if include_admin:
         ch = db.get_channel_by_id(cgid)
         if ch:
@@ -454,14 +491,103 @@ def _get_cchats(bot: DeltaBot, cgid: int, include_admin: bool = False) -> Genera
                 yield g
             else:
                 db.remove_channel(cgid)
-    for gid in db.get_cchats(cgid):
+    for gid in db.get_cchats(cgid, shared):
         g = bot.get_chat(gid)
-        if g and bot.self_contact in g.get_contacts():
+        if g and (g.is_broadcast() or bot.self_contact in g.get_contacts()):
             yield g
         else:
             db.remove_cchat(gid)
 
 
+def _add_subscriber(bot: DeltaBot, ch: sqlite3.Row, contact: Contact) -> Chat:
+    """Add contact to the given channel.
+
+    If broadcast lists are enabled, the contact is added to a broadcast list with free
+    room, otherwise a new private group is created for the contact.
+    """
+    max_size = int(_getdefault(bot, "channel_broadcast_size"))
+    if max_size <= 1:
+        g = bot.create_group(ch["name"], [contact])
+        db.add_cchat(g.id, ch["id"])
+        img = bot.get_chat(ch["admin"]).get_profile_image()
+        if img and os.path.exists(img):
+            g.set_profile_image(img)
+        return g
+
+    while True:
+        gid = db.get_free_cchat(ch["id"], max_size)
+        if gid is None:
+            break
+        g = bot.get_chat(gid)
+        if g and g.is_broadcast():
+            g.add_contact(contact)
+            _update_members(bot, g)
+            return g
+        db.remove_cchat(gid)
+
+    g = bot.get_chat(lib.dc_create_broadcast_list(bot.account._dc_context))
+    g.set_name(ch["name"])
+    g.add_contact(contact)
+    db.add_cchat(g.id, ch["id"], shared=True)
+    return g
+
+
+def _move_subscribers(
+    bot: DeltaBot, ch: sqlite3.Row, chat: Chat
+) -> Optional[List[Contact]]:
+    """Move the members of the given private group to broadcast lists.
+
+    Returns the moved contacts, or None if moving failed and was undone.
+    """
+    added = []
+    try:
+        for contact in _get_members(bot, chat):
+            added.append((contact, _add_subscriber(bot, ch, contact)))
+    except ValueError as ex:
+        bot.logger.exception(ex)
+        for contact, bchat in added:
+            bchat.remove_contact(contact)
+            _update_members(bot, bchat)
+        return None
+    db.remove_cchat(chat.id)
+    return [contact for contact, _ in added]
+
+
+def _remove_subscriber(
+    bot: DeltaBot, ch: sqlite3.Row, contact: Contact, replies: Replies
+) -> bool:
+    """Remove contact from the given channel, return False if it was not a member."""
+    for g in _get_cchats(bot, ch["id"], include_admin=True):
+        if contact in g.get_contacts():
+            g.remove_contact(contact)
+            if g.id != ch["admin"]:
+                _update_members(bot, g)
+            if g.is_broadcast():
+                replies.add(text=f"✔️Removed from {ch['name']}")
+            return True
+    return False
+
+
+def _count_subscribers(bot: DeltaBot, cgid: int) -> int:
+    """Count the subscribers of the given channel.
+
+    Only the bot changes broadcast lists so their tracked size is used, private
+    groups can be modified by their members and are counted live.
+    """
+    count = db.get_shared_members(cgid)
+    for g in _get_cchats(bot, cgid, shared=False):
+        count += len(_get_members(bot, g))
+    return count
+
+
+def _get_members(bot: DeltaBot, chat: Chat) -> List[Contact]:
+    return [c for c in chat.get_contacts() if c != bot.self_contact]
+
+
+def _update_members(bot: DeltaBot, chat: Chat) -> None:
+    db.set_cchat_members(chat.id, len(_get_members(bot, chat)))
+
+
 def _add_contact(chat: Chat, contact: Contact) -> None:
     img_path = chat.get_profile_image()
     if img_path and not os.path.exists(img_path):
@@ -491,7 +617,7 @@ def _send_diffusion(
         replies.add(
             text=text,
             html=html,
-            sender=sender,
+            sender=channel_name if chat.is_broadcast() else sender,
             quote=quote,
             filename=filename,
             viewtype=message._view_type,
@@ -1,23 +1,45 @@
 """Database management."""
 
 import sqlite3
+from logging import Logger
+from threading import Lock
 from typing import List, Optional
 
 
 class DBManager:
     """Database manager"""
 
-    def __init__(self, db_path: str) -> None:
-        self.db = sqlite3.connect(db_path, check_same_thread=False)
-        self.db.row_factory = sqlite3.Row
-        with self.db:
-            self.db.execute("PRAGMA foreign_keys = ON;")
-            self.db.execute(
+    def __init__(self, db_path: str, logger: Logger) -> None:
+        self.db_path = db_path
+        self.logger = logger
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = Lock()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        """Database connection, opened on first use."""
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    self._db = self._connect()
+        return self._db
+
+    @property
+    def is_connected(self) -> bool:
+        return self._db is not None
+
+    def _connect(self) -> sqlite3.Connection:
+        self.logger.debug(f"Opening database: {self.db_path}")
+        db = sqlite3.connect(self.db_path, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        with db:
+            db.execute("PRAGMA foreign_keys = ON;")
+            db.execute(
                 """CREATE TABLE IF NOT EXISTS groups
                 (id INTEGER PRIMARY KEY,
                 topic TEXT)"""
             )
-            self.db.execute(
+            db.execute(
                 """CREATE TABLE IF NOT EXISTS channels
                 (id INTEGER PRIMARY KEY,
                 name TEXT NOT NULL,
@@ -25,11 +47,26 @@ class DBManager:
                 admin INTEGER NOT NULL,
                 last_pub FLOAT NOT NULL DEFAULT 0)"""
             )
-            self.db.execute(
+            db.execute(
                 """CREATE TABLE IF NOT EXISTS cchats
                 (id INTEGER PRIMARY KEY,
-                channel INTEGER NOT NULL REFERENCES channels(id) ON DELETE CASCADE)"""
+                channel INTEGER NOT NULL REFERENCES channels(id) ON DELETE CASCADE,
+                members INTEGER NOT NULL DEFAULT 1,
+                shared INTEGER NOT NULL DEFAULT 0)"""
             )
+            # old databases had one private group per subscriber
+            columns = [r[1] for r in db.execute("PRAGMA table_info(cchats)")]
+            if "members" not in columns:
+                self.logger.info("Migrating database: adding cchats.members")
+                db.execute(
+                    "ALTER TABLE cchats ADD COLUMN members INTEGER NOT NULL DEFAULT 1"
+                )
+            if "shared" not in columns:
+                self.logger.info("Migrating database: adding cchats.shared")
+                db.execute(
+                    "ALTER TABLE cchats ADD COLUMN shared INTEGER NOT NULL DEFAULT 0"
+                )
+        return db
 
     # ==== groups =====
 
@@ -94,14 +131,45 @@ class DBManager:
                 "UPDATE channels SET last_pub=? WHERE id=?", (last_pub, cgid)
             )
 
-    def add_cchat(self, gid: int, cgid: int) -> None:
+    def add_cchat(
+        self, gid: int, cgid: int, members: int = 1, shared: bool = False
+    ) -> None:
+        with self.db:
+            self.db.execute(
+                "INSERT INTO cchats (id, channel, members, shared) VALUES (?,?,?,?)",
+                (gid, cgid, members, shared),
+            )
+
+    def get_cchat(self, gid: int) -> Optional[sqlite3.Row]:
+        return self.db.execute("SELECT * FROM cchats WHERE id=?", (gid,)).fetchone()
+
+    def set_cchat_members(self, gid: int, members: int) -> None:
         with self.db:
-            self.db.execute("INSERT INTO cchats VALUES (?,?)", (gid, cgid))
+            self.db.execute("UPDATE cchats SET members=? WHERE id=?", (members, gid))
 
     def remove_cchat(self, gid: int) -> None:
         with self.db:
             self.db.execute("DELETE FROM cchats WHERE id=?", (gid,))
 
-    def get_cchats(self, cgid: int) -> List[int]:
-        rows = self.db.execute("SELECT id FROM cchats WHERE channel=?", (cgid,))
+    def get_cchats(self, cgid: int, shared: Optional[bool] = None) -> List[int]:
+        if shared is None:
+            rows = self.db.execute("SELECT id FROM cchats WHERE channel=?", (cgid,))
+        else:
+            rows = self.db.execute(
+                "SELECT id FROM cchats WHERE channel=? AND shared=?", (cgid, shared)
+            )
         return [r[0] for r in rows]
+
+    def get_free_cchat(self, cgid: int, max_members: int) -> Optional[int]:
+        """Get the fullest shared chat of the given channel that has room for more members."""
+        r = self.db.execute(
+            "SELECT id FROM cchats WHERE channel=? AND shared=1 AND members<? ORDER BY members DESC LIMIT 1",
+            (cgid, max_members),
+        ).fetchone()
+        return r[0] if r else None
+
+    def get_shared_members(self, cgid: int) -> int:
+        r = self.db.execute(
+            "SELECT SUM(members) FROM cchats WHERE channel=? AND shared=1", (cgid,)
+        ).fetchone()
+        return r[0] or 0
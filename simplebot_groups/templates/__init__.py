@@ -1,9 +1,27 @@
 """Groups templates"""
 
-from jinja2 import Environment, PackageLoader, select_autoescape
+import functools
+from typing import TYPE_CHECKING
 
-env = Environment(
-    loader=PackageLoader(__name__.split(".", maxsplit=1)[0], "templates"),
-    autoescape=select_autoescape(["html", "xml"]),
-)
-template = env.get_template("list.j2")
+if TYPE_CHECKING:
+    from jinja2 import Environment, Template
+
+
+@functools.lru_cache(maxsize=None)
+def _get_env() -> "Environment":
+    from jinja2 import (  # noqa pylint: disable=C0415
+        Environment,
+        PackageLoader,
+        select_autoescape,
+    )
+
+    return Environment(
+        loader=PackageLoader(__name__.split(".", maxsplit=1)[0], "templates"),
+        autoescape=select_autoescape(["html", "xml"]),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_template(name: str) -> "Template":
+    """Get the template with the given name, it is compiled on first use."""
+    return _get_env().get_template(name)
@@ -1,3 +1,201 @@
+import logging
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+from simplebot.pytestplugin import make_bot
+
+import simplebot_groups
+from simplebot_groups.db import DBManager
+
+IMPORT_TIME_BUDGET = 100000  # microseconds
+STARTUP_TIME_BUDGET = 1  # seconds
+
+
+def _create_channel(mocker, name: str = "News") -> int:
+    mocker.get_one_reply(f"/chan {name}", addr="admin@example.org")
+    return simplebot_groups.db.get_channel_by_name(name)["id"]
+
+
+def _get_members(cgid: int) -> list:
+    db = simplebot_groups.db
+    return [db.get_cchat(gid)["members"] for gid in db.get_cchats(cgid)]
+
+
 class TestPlugin:
     def test_list(self, mocker) -> None:
         mocker.get_one_reply("/list")
+
+    def test_cchats_migration(self, tmp_path) -> None:
+        path = str(tmp_path / "sqlite.db")
+        old_db = sqlite3.connect(path)
+        with old_db:
+            old_db.execute(
+                "CREATE TABLE channels (id INTEGER PRIMARY KEY, name TEXT NOT NULL,"
+                " topic TEXT, admin INTEGER NOT NULL, last_pub FLOAT NOT NULL DEFAULT 0)"
+            )
+            old_db.execute(
+                "CREATE TABLE cchats (id INTEGER PRIMARY KEY, channel INTEGER NOT NULL"
+                " REFERENCES channels(id) ON DELETE CASCADE)"
+            )
+            old_db.execute("INSERT INTO channels (name, admin) VALUES ('News', 10)")
+            old_db.execute("INSERT INTO cchats VALUES (11, 1)")
+        old_db.close()
+
+        db = DBManager(path, logging.getLogger(__name__))
+        cchat = db.get_cchat(11)
+        assert cchat["members"] == 1
+        assert not cchat["shared"]
+        assert db.get_free_cchat(1, 100) is None
+
+    def test_private_groups(self, mocker) -> None:
+        cgid = _create_channel(mocker)
+        mocker.get_one_reply(f"/join_c{cgid}", addr="alice@example.org")
+        mocker.get_one_reply(f"/join_c{cgid}", addr="bob@example.org")
+        assert _get_members(cgid) == [1, 1]
+        for gid in simplebot_groups.db.get_cchats(cgid):
+            assert mocker.bot.get_chat(gid).is_group()
+
+    def test_broadcast_lists(self, mocker) -> None:
+        mocker.bot.set("channel_broadcast_size", "2", scope="simplebot_groups")
+        cgid = _create_channel(mocker)
+        for name in ("alice", "bob", "carol"):
+            msg = mocker.get_one_reply(f"/join_c{cgid}", addr=f"{name}@example.org")
+            assert msg.chat.is_single()
+        assert sorted(_get_members(cgid)) == [1, 2]
+        for gid in simplebot_groups.db.get_cchats(cgid):
+            assert mocker.bot.get_chat(gid).is_broadcast()
+
+        msg = mocker.get_one_reply(f"/join_c{cgid}", addr="bob@example.org")
+        assert "already a member" in msg.text
+        assert msg.chat.is_single()
+
+        mocker.get_one_reply(f"/remove_c{cgid}", addr="bob@example.org")
+        assert sorted(_get_members(cgid)) == [1, 1]
+
+        simplebot_groups.deltabot_ban(
+            bot=mocker.bot, contact=mocker.account.create_contact("carol@example.org")
+        )
+        assert sorted(_get_members(cgid)) == [0, 1]
+
+        # the fullest broadcast list with free room is used first
+        mocker.get_one_reply(f"/join_c{cgid}", addr="dave@example.org")
+        assert sorted(_get_members(cgid)) == [0, 2]
+
+        admin_chat = mocker.bot.get_chat(
+            simplebot_groups.db.get_channel_by_id(cgid)["admin"]
+        )
+        msg = mocker.get_one_reply("/info", group=admin_chat)
+        assert "👤 2" in msg.text
+
+    def test_adminmerge(self, mocker) -> None:
+        mocker.bot.add_admin("admin@example.org")
+        cgid = _create_channel(mocker)
+        mocker.get_one_reply(f"/join_c{cgid}", addr="alice@example.org")
+        msg = mocker.get_one_reply(f"/adminmerge {cgid}", addr="admin@example.org")
+        assert "disabled" in msg.text
+
+        mocker.bot.set("channel_broadcast_size", "5", scope="simplebot_groups")
+        msg = mocker.get_one_reply(f"/adminmerge {cgid}", addr="admin@example.org")
+        assert "Nothing to merge" in msg.text
+
+        mocker.bot.set("channel_broadcast_size", "1", scope="simplebot_groups")
+        mocker.get_one_reply(f"/join_c{cgid}", addr="bob@example.org")
+        old_gids = simplebot_groups.db.get_cchats(cgid)
+        mocker.bot.set("channel_broadcast_size", "5", scope="simplebot_groups")
+        msgs = mocker.get_replies(f"/adminmerge {cgid}", addr="admin@example.org")
+        assert msgs[-1].text == "✔️2 subscribers moved"
+        notices = sorted(msg.chat.get_name() for msg in msgs[:-1])
+        assert notices == ["alice@example.org", "bob@example.org"]
+        assert f"/remove_c{cgid}" in msgs[0].text
+
+        assert _get_members(cgid) == [2]
+        gid = simplebot_groups.db.get_cchats(cgid)[0]
+        assert mocker.bot.get_chat(gid).is_broadcast()
+        for gid in old_gids:
+            chat = mocker.bot.get_chat(gid)
+            assert mocker.bot.self_contact not in chat.get_contacts()
+
+        msg = mocker.get_one_reply(f"/adminmerge {cgid}", addr="admin@example.org")
+        assert "Nothing to merge" in msg.text
+
+    def test_adminmerge_rollback(self, mocker, monkeypatch) -> None:
+        mocker.bot.add_admin("admin@example.org")
+        cgid = _create_channel(mocker)
+        mocker.get_one_reply(f"/join_c{cgid}", addr="alice@example.org")
+        mocker.get_one_reply(f"/join_c{cgid}", addr="bob@example.org")
+        gid = simplebot_groups.db.get_cchats(cgid)[0]
+        mocker.bot.get_chat(gid).add_contact(
+            mocker.account.create_contact("carol@example.org")
+        )
+        mocker.bot.set("channel_broadcast_size", "5", scope="simplebot_groups")
+
+        add_subscriber = simplebot_groups._add_subscriber
+
+        def _add_subscriber(bot, ch, contact):
+            if contact.addr == "carol@example.org":
+                raise ValueError("failed")
+            return add_subscriber(bot, ch, contact)
+
+        monkeypatch.setattr(simplebot_groups, "_add_subscriber", _add_subscriber)
+        msgs = mocker.get_replies(f"/adminmerge {cgid}", addr="admin@example.org")
+        assert msgs[-1].text == "✔️1 subscribers moved"
+
+        # the group that failed to move is kept and nobody is left in both chats
+        assert simplebot_groups.db.get_cchats(cgid, shared=False) == [gid]
+        assert simplebot_groups.db.get_shared_members(cgid) == 1
+
+    def test_broadcast_sender(self, mocker) -> None:
+        mocker.bot.set("channel_broadcast_size", "5", scope="simplebot_groups")
+        cgid = _create_channel(mocker)
+        mocker.get_one_reply(f"/join_c{cgid}", addr="alice@example.org")
+        bchat = mocker.bot.get_chat(simplebot_groups.db.get_cchats(cgid)[0])
+        admin_chat = mocker.bot.get_chat(
+            simplebot_groups.db.get_channel_by_id(cgid)["admin"]
+        )
+
+        msgs = mocker.get_replies("/topic hello", group=admin_chat)
+        assert [m.override_sender_name for m in msgs if m.chat == bchat] == ["News"]
+
+        msg = mocker.make_incoming_message(
+            "post", group=admin_chat, addr="Admin <admin@example.org>"
+        )
+        simplebot_groups._send_diffusion(mocker.bot, "News", msg, [bchat])
+        assert bchat.get_messages()[-1].override_sender_name == "News"
+
+    def test_import_time(self) -> None:
+        # simplebot and deltachat are imported first so only the plugin's own
+        # import cost is measured, the budget is far below loading cairosvg
+        code = (
+            "import sys, simplebot, deltachat\n"
+            "import simplebot_groups\n"
+            "print('cairosvg' in sys.modules)\n"
+            "print(simplebot_groups.get_template.cache_info().currsize)\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+        assert result.stdout.split() == ["False", "0"]
+        for line in result.stderr.splitlines():
+            if line.endswith("| simplebot_groups"):
+                cumulative = int(line.split("|")[1])
+                break
+        else:
+            pytest.fail("simplebot_groups not in importtime output")
+        assert cumulative < IMPORT_TIME_BUDGET
+
+    def test_startup_time(self, acfactory, request) -> None:
+        account = acfactory.get_pseudo_configured_account()
+        start = time.perf_counter()
+        make_bot(request, account, request.module)
+        assert time.perf_counter() - start < STARTUP_TIME_BUDGET
+
+    def test_lazy_db(self, mocker) -> None:
+        assert not simplebot_groups.db.is_connected
+        mocker.get_one_reply("/list")
+        assert simplebot_groups.db.is_connected